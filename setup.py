@@ -33,14 +33,19 @@ setup(
                  'License :: OSI Approved :: GNU General Public License v3 (GPLv3)',
                  'Natural Language :: English',
                  'Operating System :: POSIX :: Linux',
-                 'Programming Language :: Python :: 3.5',
+                 'Programming Language :: Python :: 3 :: Only',
+                 'Programming Language :: Python :: 3.6',
                  'Topic :: Utilities'],
     license='GPLv3',
     keywords='toptranslation api wrapper',
     packages=[PACKAGE_NAME],
+    python_requires='>=3.6',
     package_data={'': ['COPYING'], PACKAGE_NAME: ['*.ini']},
-    install_requires=['decorator>=3.4.2', 'requests>=2.3.0', 'six>=1.4',
-                      'update_checker>=0.11'],
+    install_requires=['decorator>=3.4.2', 'requests>=2.25',
+                      'requests-toolbelt>=0.8.0', 'update_checker>=0.11',
+                      'urllib3>=1.26'],
+    extras_require={'async': ['aiohttp>=3.3'],
+                    'speedups': ['ijson>=3.1', 'orjson>=3.0']},
     tests_require=['betamax>=0.4.2', 'betamax-matchers>=0.2.0',
                    'betamax_serializers>=0.1.1', 'mock>=1.0.0'],
     entry_points={'console_scripts': [
@@ -1,3 +1 @@
 """TPAW Test Suite."""
-
-from __future__ import print_function, unicode_literals
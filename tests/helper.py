@@ -1,3 +1,42 @@
 """Test helper methods."""
 
-from __future__ import print_function, unicode_literals
+from requests import Response
+
+from tpaw import Toptranslation
+
+
+class FakeSend(object):
+    """Replacement for ``Session.send`` that records the requests it gets.
+
+    Every request is answered with `status` and the JSON document `body`.
+
+    """
+
+    def __init__(self, status=200, body=b'{"data": []}'):
+        self.requests = []
+        self.status = status
+        self.body = body
+
+    def __call__(self, request, **_):
+        self.requests.append(request)
+        response = Response()
+        response.status_code = self.status
+        response.headers['Content-Type'] = 'application/json'
+        response._content = self.body  # pylint: disable=W0212
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def offline_client(**kwargs):
+    """Return a Toptranslation client whose requests are answered locally.
+
+    The FakeSend answering the requests is available as `client.sent`.
+
+    """
+    kwargs.setdefault('log_requests', 0)
+    kwargs.setdefault('api_request_delay', 0)
+    client = Toptranslation('TPAW test suite', **kwargs)
+    client.sent = FakeSend()
+    client.handler.http.send = client.sent
+    return client
@@ -0,0 +1,131 @@
+"""Tests for the asyncio client, whose aiohttp session is replaced."""
+
+import asyncio
+import os
+import tempfile
+import unittest
+from http.cookies import SimpleCookie
+from unittest import mock
+
+from tpaw import errors
+
+try:
+    from yarl import URL
+    from tpaw.async_client import AsyncToptranslation, _fields
+except ImportError:
+    AsyncToptranslation = None
+
+
+class FakeResponse(object):
+    """Stand-in for an aiohttp response with a JSON body."""
+
+    content_type = 'application/json'
+
+    def __init__(self, url, status, cookies):
+        self.url = URL(url)
+        self.status = status
+        self.cookies = SimpleCookie(cookies)
+        self.body = b'{"data": []}'
+
+    async def read(self):
+        return self.body
+
+    async def text(self):
+        return self.body.decode('utf-8')
+
+
+class FakeClient(object):
+    """Stand-in for an aiohttp session that records its requests.
+
+    The n-th request is answered with the n-th of `statuses`, the last one
+    answers every later request. `cookies` are set by the first response.
+
+    """
+
+    def __init__(self, statuses=(200,), cookies=''):
+        self.requests = []
+        self.statuses = list(statuses)
+        self.cookies = cookies
+
+    async def request(self, method, url, **kwargs):
+        self.requests.append((method, url, kwargs))
+        index = min(len(self.requests), len(self.statuses)) - 1
+        cookies = self.cookies if len(self.requests) == 1 else ''
+        return FakeResponse(url, self.statuses[index], cookies)
+
+    async def close(self):
+        pass
+
+
+@unittest.skipIf(AsyncToptranslation is None, 'aiohttp is not installed')
+class AsyncClientTest(unittest.TestCase):
+    def setUp(self):
+        self.client = AsyncToptranslation('TPAW test suite', log_requests=0,
+                                          api_request_delay=0)
+        self.sleeps = []
+        patcher = mock.patch('asyncio.sleep', new=self.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+
+    def complete(self, coroutine):
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.close()
+
+    def answer(self, *args, **kwargs):
+        fake = FakeClient(*args, **kwargs)
+        self.client._client = fake  # pylint: disable=W0212
+        return fake
+
+    def test_no_handler(self):
+        self.assertIsNone(self.client.handler)
+        self.assertEqual(0, self.client.evict('any url'))
+        self.assertRaises(TypeError, AsyncToptranslation, 'TPAW test suite',
+                          handler=object())
+
+    def test_retries_then_raises(self):
+        fake = self.answer([503])
+        self.assertRaises(errors.HTTPException, self.complete,
+                          self.client.show_order('abc'))
+        self.assertEqual(4, len(fake.requests))
+        self.assertEqual([0.25, 0.5, 1.0], self.sleeps)
+
+    def test_retry_succeeds(self):
+        fake = self.answer([503, 200])
+        result = self.complete(self.client.show_order('a'))
+        self.assertEqual({'data': []}, result)
+        self.assertEqual(2, len(fake.requests))
+
+    def test_form_is_not_retried(self):
+        fake = self.answer([503, 200])
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        self.assertRaises(errors.HTTPException, self.complete,
+                          self.client.upload_document('token', path, 'doc'))
+        self.assertEqual(1, len(fake.requests))
+        _, _, kwargs = fake.requests[0]
+        self.assertNotIn('Content-Type', kwargs['headers'])
+
+    def test_none_params_are_dropped(self):
+        fake = self.answer()
+        self.complete(self.client.list_orders(state=None))
+        _, _, kwargs = fake.requests[0]
+        self.assertNotIn('state', dict(kwargs['params']))
+
+    def test_fields(self):
+        self.assertEqual([('b', 1), ('b', 2)],
+                         _fields({'a': None, 'b': [1, None, 2]}))
+
+    def test_cookies_round_trip(self):
+        fake = self.answer(cookies='session=value')
+        self.complete(self.client.show_order('a'))
+        self.complete(self.client.show_order('b'))
+        _, _, kwargs = fake.requests[1]
+        self.assertEqual('session=value', kwargs['headers']['Cookie'])
+        self.assertEqual('value', self.client.http.cookies['session'])
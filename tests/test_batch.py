@@ -0,0 +1,32 @@
+"""Tests for BaseTT.batch."""
+
+import unittest
+from urllib.parse import parse_qs, urlsplit
+
+from tests.helper import offline_client
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.client = offline_client(access_token='secret')
+
+    def query(self, request):
+        return parse_qs(urlsplit(request.url).query)
+
+    def test_access_token_is_added(self):
+        self.client.batch([('GET', 'show_order', {'identifier': 'a'}),
+                           ('GET', 'show_order', {'identifier': 'b'})])
+        self.assertEqual(2, len(self.client.sent.requests))
+        for request in self.client.sent.requests:
+            self.assertEqual(['secret'],
+                             self.query(request)['access_token'])
+
+    def test_access_token_is_added_to_body(self):
+        self.client.batch([('POST', 'rate_order', {'identifier': 'a'})])
+        request, = self.client.sent.requests
+        self.assertIn('access_token=secret', request.body)
+
+    def test_none_values_are_left_out(self):
+        self.client.batch([('GET', 'list_orders', {'state': None})])
+        request, = self.client.sent.requests
+        self.assertNotIn('state', self.query(request))
@@ -0,0 +1,96 @@
+"""Tests for the GET response cache of DefaultHandler."""
+
+import unittest
+from unittest import mock
+
+from tests.helper import offline_client
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.client = offline_client()
+
+    def test_identical_get_is_served_from_cache(self):
+        self.client.show_order('abc')
+        self.client.show_order('abc')
+        self.assertEqual(1, len(self.client.sent.requests))
+
+    def test_different_params_are_cached_separately(self):
+        self.client.list_orders(page=1)
+        self.client.list_orders(page=2)
+        self.assertEqual(2, len(self.client.sent.requests))
+
+    def test_entries_expire(self):
+        with mock.patch('tpaw.handlers.timer', return_value=100.0):
+            self.client.show_order('abc')
+        with mock.patch('tpaw.handlers.timer', return_value=131.0):
+            self.client.show_order('abc')
+        self.assertEqual(2, len(self.client.sent.requests))
+
+    def test_disabled_with_non_positive_timeout(self):
+        client = offline_client(cache_timeout=0)
+        client.show_order('abc')
+        client.show_order('abc')
+        self.assertEqual(2, len(client.sent.requests))
+
+    def test_write_evicts_same_url(self):
+        self.client.show_order('abc')
+        self.client.update_order('abc', name='new name')
+        self.client.show_order('abc')
+        methods = [request.method for request in self.client.sent.requests]
+        self.assertEqual(['GET', 'PATCH', 'GET'], methods)
+
+    def test_create_order_evicts_list_orders(self):
+        self.client.list_orders()
+        self.client.create_order(name='order')
+        self.client.list_orders()
+        self.assertEqual(3, len(self.client.sent.requests))
+
+    def test_request_order_evicts_show_order(self):
+        self.client.show_order('abc')
+        self.client.request_order('abc')
+        self.client.show_order('abc')
+        self.assertEqual(3, len(self.client.sent.requests))
+
+    def test_evict_returns_number_of_entries_removed(self):
+        self.client.list_orders(page=1)
+        self.client.list_orders(page=2)
+        url = self.client.config['list_orders']
+        self.assertEqual(2, self.client.evict(url))
+        self.assertEqual(0, self.client.evict(url))
+
+    def test_size_is_capped(self):
+        self.client.handler.CACHE_SIZE = 3
+        for page in range(5):
+            self.client.list_orders(page=page)
+        self.assertEqual(3, len(self.client.handler.cache))
+
+    def test_list_params_are_cached(self):
+        url = self.client.config['list_orders']
+        self.client.request_json(url, params={'state': ['a', 'b']})
+        self.client.request_json(url, params={'state': ['a', 'b']})
+        self.assertEqual(1, len(self.client.sent.requests))
+
+    def test_unhashable_params_bypass_cache(self):
+        url = self.client.config['list_orders']
+        self.client.request_json(url, params={'state': [['a']]})
+        self.client.request_json(url, params={'state': [['a']]})
+        self.assertEqual(2, len(self.client.sent.requests))
+
+    def test_cache_is_per_client(self):
+        other = offline_client()
+        self.client.show_order('abc')
+        other.show_order('abc')
+        self.assertEqual(1, len(self.client.sent.requests))
+        self.assertEqual(1, len(other.sent.requests))
+
+    def test_headers_are_part_of_the_key(self):
+        url = self.client.config['list_orders']
+        self.client.request_json(url, headers={'Authorization': 'bearer a'})
+        self.client.request_json(url, headers={'Authorization': 'bearer b'})
+        self.assertEqual(2, len(self.client.sent.requests))
+
+    def test_get_content_is_cached(self):
+        list(self.client.get_locales())
+        list(self.client.get_locales())
+        self.assertEqual(1, len(self.client.sent.requests))
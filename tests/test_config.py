@@ -0,0 +1,33 @@
+"""Tests for the URL building of Config."""
+
+import unittest
+
+from tpaw import errors
+from tests.helper import offline_client
+
+
+class UrlTest(unittest.TestCase):
+    def setUp(self):
+        self.client = offline_client()
+        self.config = self.client.config
+
+    def test_identifier_is_filled_in(self):
+        url = self.config.url('show_order', 'abc')
+        self.assertIn('/abc', url)
+        self.assertNotIn('{identifier}', url)
+
+    def test_unknown_key(self):
+        self.assertRaises(errors.ClientException, self.config.url, 'nope')
+
+    def test_identifier_for_plain_path(self):
+        self.assertRaises(errors.ClientException, self.config.url,
+                          'list_orders', 'abc')
+
+    def test_missing_identifier(self):
+        self.assertRaises(errors.ClientException, self.config.url,
+                          'show_order')
+
+    def test_batch_validates_identifiers(self):
+        self.assertRaises(errors.ClientException, self.client.batch,
+                          [('GET', 'show_order', {})])
+        self.assertEqual([], self.client.sent.requests)
@@ -0,0 +1,17 @@
+"""Tests for the error classes."""
+
+import copy
+import pickle
+import unittest
+
+from tpaw import errors
+
+
+class ErrorTest(unittest.TestCase):
+    def test_message_survives_copy(self):
+        error = copy.copy(errors.ClientException('custom msg'))
+        self.assertEqual('custom msg', error.message)
+
+    def test_message_survives_pickle(self):
+        error = pickle.loads(pickle.dumps(errors.ClientException('custom')))
+        self.assertEqual('custom', str(error))
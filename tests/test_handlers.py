@@ -0,0 +1,86 @@
+"""Tests for the HTTP sessions of DefaultHandler."""
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from tpaw import errors
+from tpaw.handlers import DefaultHandler
+from tests.helper import FakeSend, offline_client
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        self.client = offline_client()
+        self.streamed = FakeSend(body=b'{}')
+        self.client.handler.stream_http.send = self.streamed
+
+    def test_streamed_session_never_retries(self):
+        for scheme in ('http://', 'https://'):
+            adapter = self.client.handler.stream_http.get_adapter(scheme)
+            self.assertEqual(0, adapter.max_retries.total)
+
+    def test_retry_policy(self):
+        http = self.client.handler.http
+        retry = http.get_adapter('https://').max_retries
+        self.assertEqual(3, retry.total)
+        self.assertEqual(0, retry.read)
+        self.assertFalse(retry.raise_on_status)
+        self.assertEqual((502, 503, 504), tuple(retry.status_forcelist))
+        self.assertEqual({'GET', 'POST', 'PATCH', 'PUT', 'DELETE'},
+                         set(retry.allowed_methods))
+        self.assertIs(retry, http.get_adapter('http://').max_retries)
+
+    def test_upload_uses_streamed_session(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        self.client.upload_document('token', path, 'document')
+        self.assertEqual(1, len(self.streamed.requests))
+        self.assertEqual([], self.client.sent.requests)
+
+    def test_json_body_uses_retrying_session(self):
+        self.client.update_order('abc', name='new name')
+        self.assertEqual(1, len(self.client.sent.requests))
+        self.assertEqual([], self.streamed.requests)
+
+
+class PrepareCacheTest(unittest.TestCase):
+    def test_size_is_bounded(self):
+        client = offline_client()
+        client.PREP_CACHE_SIZE = 3
+        for identifier in range(5):
+            client.show_order(identifier)
+        self.assertEqual(3, len(client._prep_cache))  # pylint: disable=W0212
+        self.assertEqual(5, len(client.sent.requests))
+
+
+class TakeTokenTest(unittest.TestCase):
+    def setUp(self):
+        bucket = DefaultHandler.rl_bucket
+        self.addCleanup(bucket.__setitem__, slice(None), list(bucket))
+        bucket[:] = [None, 0.0]
+
+    def take(self, now, rate_delay=1.0, burst=3):
+        with mock.patch('tpaw.handlers.timer', return_value=now):
+            return DefaultHandler.take_token(rate_delay, burst)
+
+    def test_burst_then_spacing(self):
+        delays = [self.take(100.0) for _ in range(6)]
+        self.assertEqual([0, 0, 0, 1.0, 2.0, 3.0], delays)
+
+    def test_refills_when_idle(self):
+        for _ in range(3):
+            self.take(100.0)
+        self.assertEqual(1.0, self.take(100.0))
+        # The reserved token is refilled after 1s, two more by 103s
+        self.assertEqual([0, 0, 1.0], [self.take(103.0) for _ in range(3)])
+
+    def test_disabled_without_delay(self):
+        self.assertEqual(0, self.take(100.0, rate_delay=0))
+        self.assertEqual([None, 0.0], DefaultHandler.rl_bucket)
+
+    def test_burst_below_one_is_rejected(self):
+        self.assertRaises(errors.ClientException, offline_client,
+                          api_request_burst=0)
@@ -8,20 +8,33 @@ More info can be found at https://developer.toptranslation.com
 """
 
 # standard imports
-import json
+import http.cookiejar as http_cookiejar
 import os
 import sys
-import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from html import unescape
+from threading import Lock
 from requests import Session
 from requests.compat import urljoin
-# six imports
-import six
-from six.moves import html_entities, http_cookiejar
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    import json
+
+    def _json_loads(raw):
+        """Return the object decoded from the UTF-8 JSON document raw."""
+        return json.loads(raw.decode('utf-8'))
+try:
+    import ijson
+except ImportError:
+    ijson = None
 # tpaw imports
 from tpaw import errors
 from tpaw.handlers import DefaultHandler
 from tpaw.settings import CONFIG
-from tpaw.internal import _prepare_request
+from tpaw.internal import _prepare_request, _raise_response_exceptions
 __version__ = '0.0.1'
 
 
@@ -75,29 +88,69 @@ class Config(object):
         self.api_url = 'https://' + obj['api_domain']
         self.api_version = 'v' + obj['api_version']
         self.document_url = 'https://' + obj['document_domain']
+        self.oauth_url = 'https://' + (obj.get('oauth_domain') or
+                                       obj['api_domain'])
         self.api_request_delay = float(obj['api_request_delay'])
+        self.api_request_burst = int(obj['api_request_burst'])
+        if self.api_request_burst < 1:
+            raise errors.ClientException(
+                'api_request_burst must be at least 1')
         self.cache_timeout = float(obj['cache_timeout'])
         self.log_requests = int(obj['log_requests'])
         self.timeout = float(obj['timeout'])
+        self.pool_size = int(obj['pool_size'])
         self.access_token = obj.get('access_token') or None
         self.http_proxy = (obj.get('http_proxy') or
                            os.getenv('http_prox') or None)
         self.https_proxy = (obj.get('https_proxy') or
                             os.getenv('https_prox') or None)
 
+        # Resolve every URL once, the domains do not change after init
+        self._urls = {
+            key: urljoin(self.api_url, self.api_version + '/' + path)
+            for key, path in self.API_PATHS.items()}
+        self._doc_urls = {key: urljoin(self.document_url, path)
+                          for key, path in self.API_PATHS.items()}
+        # Split templated URLs around their placeholder, so they can be
+        # filled in by concatenation
+        self._url_parts = {key: tuple(url.split('{identifier}'))
+                           for key, url in self._urls.items()
+                           if '{identifier}' in url}
+
     def __getitem__(self, key):
         """Return the URL for key."""
-        return urljoin(self.api_url, self.api_version + '/' +
-                       self.API_PATHS[key])
+        return self._urls[key]
+
+    def url(self, key, identifier=None):
+        """Return the URL for key, filled in with identifier if given.
+
+        :raises ClientException: When key is unknown, or when identifier is
+            given for a URL without placeholder or missing for one with it.
+
+        """
+        if key not in self._urls:
+            raise errors.ClientException('Unknown API path {0!r}'.format(key))
+        if identifier is None:
+            if key in self._url_parts:
+                raise errors.ClientException(
+                    'API path {0!r} requires an identifier'.format(key))
+            return self._urls[key]
+        if key not in self._url_parts:
+            raise errors.ClientException(
+                'API path {0!r} does not take an identifier'.format(key))
+        prefix, suffix = self._url_parts[key]
+        return prefix + str(identifier) + suffix
 
     def document_store_url(self, key):
         """Returns the DocumentStore URL"""
-        return urljoin(self.document_url, self.API_PATHS[key])
+        return self._doc_urls[key]
 
 
 class BaseTT(object):
     """A base class that allows access to Toptranslation's API"""
-    RETRY_CODES = [502, 503, 504]
+
+    PREP_CACHE_SIZE = 64
+    _params_base = ()  # (key, value) pairs sent with every API call
 
     def __init__(self, user_agent, site_name=None,
                  handler=None, **kwargs):
@@ -119,17 +172,26 @@ class BaseTT(object):
         initialize the Config object.
         """
 
-        if not user_agent or not isinstance(user_agent, six.string_types):
+        if not user_agent or not isinstance(user_agent, str):
             raise TypeError('user agent must be a non-empty string')
 
         self.config = Config(site_name or 'toptranslation', **kwargs)
-        self.handler = handler or DefaultHandler()
+        self.handler = handler or self._default_handler()
         self.http = Session()
         self.http.headers['User-Agent'] = self.config.ua_string(user_agent)
+        # The session headers do not change after this point, so the dict
+        # merged into every request is built only once.
+        self._base_headers = dict(self.http.headers)
+        self._bearer = ('bearer ' + self.config.access_token
+                        if self.config.access_token else None)
+        self._prep_cache = OrderedDict()  # (method, url): PreparedRequest
+        self._prep_lock = Lock()
 
         # This `Session` object is only used to store request information that
-        # is used to make prepared requests. It _should_ never be used to make
-        # a direct request, thus we raise an exception when it is used.
+        # is used to make prepared requests (headers, cookies and proxies). It
+        # _should_ never be used to make a direct request, thus we raise an
+        # exception when it is used. All traffic goes through the pooled
+        # session owned by the handler.
 
         def _req_error(*_, **__):
             raise errors.ClientException('Do not make direct requests.')
@@ -143,8 +205,8 @@ class BaseTT(object):
                 self.http.proxies['https'] = self.config.https_proxy
 
     def _request(self, url, params=None, data=None, files=None, auth=None,
-                 timeout=None, raw_response=False, retry_on_error=False,
-                 method=None):
+                 timeout=None, raw_response=False, method=None,
+                 headers=None, stream=False):
         """Given a page url and a dict of params, open and return the page.
 
         :param url: the url to grab content from.
@@ -156,74 +218,197 @@ class BaseTT(object):
             can take.
         :param raw_response: return the response object rather than the
             response body
-        :param retry_on_error: if True retry the request, if it fails, for up
-            to 3 attempts
+        :param headers: a dictionary of extra headers to send
+        :param stream: if True the body is not downloaded until it is read
+            from the response, which is then never cached. Only useful with
+            raw_response.
         :returns: either the response body or the response object
 
+        Retrying failed requests is left to the handler. An HTTPException is
+        raised when the final response has an error status code.
+
         """
-        def build_key_items(url, params, data, auth, files, method):
+        def freeze(items):
+            """Return items as a sorted tuple, with lists made hashable."""
+            return tuple(sorted(
+                (key, tuple(value) if isinstance(value, list) else value)
+                for key, value in items))
+
+        def build_key_items(url, params, data, auth, files, method, headers):
             request = _prepare_request(self, url, params, data, auth, files,
-                                       method)
+                                       method, headers)
             # Prepare extra arguments
-            key_items = []
+            key_items = [freeze(request.headers.items())]
             for key_value in (params, data, request.cookies, auth):
                 if isinstance(key_value, dict):
-                    key_items.append(tuple(key_value.items()))
+                    key_items.append(freeze(key_value.items()))
                 elif isinstance(key_value, http_cookiejar.CookieJar):
-                    key_items.append(tuple(key_value.get_dict().items()))
+                    key_items.append(freeze(key_value.get_dict().items()))
                 else:
                     key_items.append(key_value)
-            kwargs = {'_rate_delay': int(self.config.api_request_delay)}
+            cache_key = (request.url, tuple(key_items))
+            # Only idempotent GET requests are served from the cache
+            cache_ignore = request.method != 'GET'
+            if not cache_ignore:
+                try:
+                    hash(cache_key)
+                except TypeError:  # e.g. a dict nested in the params
+                    cache_ignore = True
+            kwargs = {'_rate_delay': self.config.api_request_delay,
+                      '_rate_burst': self.config.api_request_burst,
+                      '_cache_key': cache_key,
+                      '_cache_ignore': cache_ignore,
+                      '_cache_timeout': self.config.cache_timeout}
 
             return (request, key_items, kwargs)
 
-        def decode(match):
-            return html_entities.name2codepoint[match.group(1)]
-
         timeout = self.config.timeout if timeout is None else timeout
         request, key_items, kwargs = build_key_items(url, params, data,
-                                                     auth, files, method)
-        try:
-            response = self.handler.request(
-                request=request.prepare(),
-                proxies=self.http.proxies,
-                timeout=timeout, **kwargs)
-            if self.config.log_requests >= 2:
-                msg = 'status: {0}\n'.format(response.status_code)
-                sys.stderr.write(msg)
-            self.http.cookies.update(response.cookies)
-            return re.sub('&([^;]+);', decode, response.text)
-        except errors.HTTPException as error:
-            # pylint: disable=W0212
-            if error._raw.status_code not in self.RETRY_CODES:
-                raise
+                                                     auth, files, method,
+                                                     headers)
+        if stream:
+            kwargs.update(_cache_ignore=True, stream=True)
+        if headers or files or auth:
+            prepared = request.prepare()
+        else:
+            prepared = self._prepare(request)
+        response = self.handler.request(
+            request=prepared,
+            proxies=self.http.proxies,
+            timeout=timeout, **kwargs)
+        if self.config.log_requests >= 2:
+            msg = 'status: {0}\n'.format(response.status_code)
+            sys.stderr.write(msg)
+        _raise_response_exceptions(response)
+        if request.method != 'GET':
+            # The cached GET responses of this url are now stale
+            self.evict(request.url)
+        self.http.cookies.update(response.cookies)
+        if raw_response:
+            return response
+        # JSON bodies never carry HTML entities, only decode everything else
+        content_type = response.headers.get('Content-Type', '')
+        if content_type.startswith('application/json'):
+            return response.text
+        return unescape(response.text)
+
+    def _params(self, *items):
+        """Return the params of a request made of _params_base and items.
+
+        Items are (key, value) pairs, those whose value is None are left out.
+
+        """
+        return {key: value for key, value in self._params_base + items
+                if value is not None}
+
+    def _default_handler(self):
+        """Return the handler used when none is given."""
+        return DefaultHandler(pool_size=self.config.pool_size)
+
+    def evict(self, urls):
+        """Evict url(s) from the cache.
+
+        :param urls: A url or an iterable containing urls, without their
+            query string.
+        :returns: The number of items removed from the cache.
+
+        """
+        return self.handler.evict(urls)
+
+    def _prepare(self, request):
+        """Return the prepared request, reusing a cached skeleton if possible.
+
+        The headers of a request only depend on its method and url, so they
+        are prepared once and only the query string, the body and the
+        cookies are prepared again on later calls. Requests whose body is
+        not form data have per call headers and are never cached. At most
+        PREP_CACHE_SIZE skeletons are kept, the oldest one is dropped first.
+
+        """
+        if request.method != 'GET' and not isinstance(request.data, dict):
+            return request.prepare()
+        key = (request.method, request.url)
+        skeleton = self._prep_cache.get(key)
+        if skeleton is None:
+            prepared = request.prepare()
+            with self._prep_lock:
+                if len(self._prep_cache) >= self.PREP_CACHE_SIZE:
+                    self._prep_cache.popitem(last=False)
+                self._prep_cache[key] = prepared.copy()
+            return prepared
+        prepared = skeleton.copy()
+        prepared.prepare_url(request.url, request.params)
+        prepared.prepare_body(request.data, request.files)
+        prepared.headers.pop('Cookie', None)
+        if len(request.cookies):
+            prepared.prepare_cookies(request.cookies)
+        return prepared
 
     def get_content(self, url, params=None, method=None, root_field='data',
-                    **kwargs):
-        """Method to return JSON Content"""
-        params = params or {}
-        data = self.request_json(url, method=method, params=params)
-        root = data.get(root_field, data)
-        for thing in root:
-            yield thing
+                    stream=False, **kwargs):
+        """Method to return JSON Content
+
+        :param stream: When True and ijson is installed, the items of the
+            `root_field` array are parsed and yielded while the response is
+            being downloaded. Streamed responses are never cached.
 
-    def request(self, url, params=None, data=None, retry_on_error=False,
-                method=None, files=None):
+        """
+        params = params or {}
+        if not stream or ijson is None:
+            data = self.request_json(url, method=method, params=params)
+            root = data.get(root_field, data)
+            for thing in root:
+                yield thing
+            return
+        response = self._request(url, params=params, method=method,
+                                 raw_response=True, stream=True)
+        response.raw.decode_content = True
+        try:
+            for thing in ijson.items(response.raw, root_field + '.item',
+                                     use_float=True):
+                yield thing
+        finally:
+            response.close()
+
+    def request(self, url, params=None, data=None, method=None, files=None,
+                headers=None):
         """Make a HTTP request and return the response"""
         return self._request(url, params, data, raw_response=True,
-                             retry_on_error=retry_on_error, method=method,
-                             files=files)
+                             method=method, files=files, headers=headers)
 
     def request_json(self, url, params=None, data=None, as_objects=True,
-                     retry_on_error=False, method=None, files=None):
+                     method=None, files=None, headers=None):
         """Get the JSON processed from a page"""
-        response = self._request(url, params, data, method=method,
-                                 files=files, retry_on_error=retry_on_error)
-        self._request_url = url
+        response = self._request(url, params, data, raw_response=True,
+                                 method=method, files=files, headers=headers)
+        return _json_loads(response.content)
+
+    def batch(self, requests):
+        """Perform several API calls concurrently and return their JSON.
+
+        :param requests: An iterable of ``(method, key, params)`` tuples,
+            where `key` is an entry of Config.API_PATHS whose placeholder
+            is filled from the `identifier` of `params`. The params are
+            sent in the query string for GET requests and in the body
+            otherwise. Like for the API methods, the `access_token` is
+            added and None values are left out.
+        :returns: A list with the JSON of each call, in the same order.
+
+        The calls share the handler's connection pool, which is thread
+        safe, and are still subject to its rate limiting. The first error
+        raised by any of the calls is re-raised.
 
-        data = json.loads(response)
-        delattr(self, '_request_url')
-        return data
+        """
+        def perform(item):
+            method, key, params = item
+            url = self.config.url(key, params.get('identifier'))
+            params = self._params(*params.items())
+            if method == 'GET':
+                return self.request_json(url, params=params, method=method)
+            return self.request_json(url, data=params, method=method)
+
+        with ThreadPoolExecutor(max_workers=self.config.pool_size) as pool:
+            return list(pool.map(perform, requests))
 
 
 class UnauthenticatedTT(BaseTT):
@@ -256,7 +441,8 @@ class AuthenticatedTT(UnauthenticatedTT):
     def __init__(self, *args, **kwargs):
         """Initialize an Authenticated instance"""
         super(AuthenticatedTT, self).__init__(*args, **kwargs)
-        self.params = {"access_token": self.config.access_token}
+        self._access_token = self.config.access_token
+        self._params_base = (('access_token', self._access_token),)
 
     def upload_token(self, *args, **kwargs):
         """To  upload  to  the   document  store  requires  an  upload
@@ -264,11 +450,11 @@ class AuthenticatedTT(UnauthenticatedTT):
         upload_token. Upload tokens  will expire after a  give time so
         they should only be used  right before the upload takes place.
         """
-        if self.config.access_token is None:
+        if self._access_token is None:
             return super(AuthenticatedTT, self).upload_token(*args, **kwargs)
         else:
             url = self.config['upload_token']
-            data = {"access_token": self.config.access_token}
+            data = self._params()
             return self.request_json(url, data=data, method='POST', *args,
                                      **kwargs)['data']['upload_token']
 
@@ -279,9 +465,9 @@ class OrderMixin(AuthenticatedTT):
                     team_identifier=None):
         """returns all orders of a user."""
         url = self.config['list_orders']
-        params = self.params
-        params.update({'page': page, 'per_page': per_page, 'state': state,
-                       'team_identifier': team_identifier})
+        params = self._params(('page', page), ('per_page', per_page),
+                              ('state', state),
+                              ('team_identifier', team_identifier))
         return self.request_json(url, params=params, method='GET')
 
     def create_order(self, name=None, reference=None, comment=None,
@@ -289,44 +475,44 @@ class OrderMixin(AuthenticatedTT):
                      service_level=None, cost_center_identifier=None):
         """create a new order"""
         url = self.config['create_order']
-        data = self.params
-        data.update({'name': name, 'reference': reference,
-                     'commment': comment, 'coupon_code': coupon_code,
-                     'desired_delivery_date': desired_delivery_date,
-                     'service_level': service_level,
-                     'cost_center_identifier': cost_center_identifier})
+        data = self._params(
+            ('name', name), ('reference', reference), ('commment', comment),
+            ('coupon_code', coupon_code),
+            ('desired_delivery_date', desired_delivery_date),
+            ('service_level', service_level),
+            ('cost_center_identifier', cost_center_identifier))
         return self.request_json(url, data=data, method='POST')
 
     def update_order(self, identifier, reference=None, name=None,
                      cost_center_identifier=None):
         """update an order"""
-        url = self.config['update_order'].format(identifier=identifier)
-        params = self.params
-        params.update({'identifier': identifier, 'reference': reference,
-                       'name': name,
-                       'cost_center_identifier': cost_center_identifier})
+        url = self.config.url('update_order', identifier)
+        params = self._params(
+            ('identifier', identifier), ('reference', reference),
+            ('name', name), ('cost_center_identifier', cost_center_identifier))
         return self.request_json(url, params=params, method='PATCH')
 
     def show_order(self, identifier):
         """show an order"""
-        url = self.config['show_order'].format(identifier=identifier)
-        params = self.params
-        params.update({'identifier': identifier})
+        url = self.config.url('show_order', identifier)
+        params = self._params(('identifier', identifier))
         return self.request_json(url, params=params, method='GET')
 
     def request_order(self, identifier):
         """request an order"""
-        url = self.config['request_order'].format(identifier=identifier)
-        params = self.params
-        params.update({'identifier': identifier})
-        return self.request_json(url, params=params, method='PATCH')
+        url = self.config.url('request_order', identifier)
+        params = self._params(('identifier', identifier))
+        order = self.request_json(url, params=params, method='PATCH')
+        self.evict(self.config.url('show_order', identifier))
+        return order
 
     def rate_order(self, identifier):
         """rate an order"""
-        url = self.config['rate_order'].format(identifier=identifier)
-        data = self.params
-        data.update({'identifier': identifier})
-        return self.request_json(url, data=data, method='POST')
+        url = self.config.url('rate_order', identifier)
+        data = self._params(('identifier', identifier))
+        rating = self.request_json(url, data=data, method='POST')
+        self.evict(self.config.url('show_order', identifier))
+        return rating
 
 
 class DocumentMixin(AuthenticatedTT):
@@ -334,10 +520,15 @@ class DocumentMixin(AuthenticatedTT):
     def upload_document(self, token, document, document_type):
         """Upload a document"""
         url = self.config.document_store_url('upload_document')
-        data = {"token": token, "type": document_type}
-        return self.request_json(url, data=data,
-                                 files={'file': open(document, 'rb')},
-                                 method='POST')
+        with open(document, 'rb') as handle:
+            # Stream the file from disk rather than loading it in memory
+            data = MultipartEncoder(fields={
+                'token': token, 'type': document_type,
+                'file': (os.path.basename(document), handle,
+                         'application/octet-stream')})
+            return self.request_json(
+                url, data=data, method='POST',
+                headers={'Content-Type': data.content_type})
 
     def download_document(self, token, identifier):
         """Download a document"""
@@ -348,21 +539,20 @@ class DocumentMixin(AuthenticatedTT):
 
     def list_documents(self, identifier):
         """List documents of an order"""
-        url = self.config['list_documents'].format(identifier=identifier)
-        params = self.params
+        url = self.config.url('list_documents', identifier)
+        params = self._params()
         return self.request_json(url, params=params, method='GET')
 
     def add_document(self, identifier, document_store_id, document_token,
                      locale_code, target_locale_codes, name=None):
         """Add a document to an order"""
-        url = self.config['add_document'].format(identifier=identifier)
-        data = self.params
-        data.update({'identifier': identifier,
-                     'document_store_id': document_store_id,
-                     'document_token': document_token,
-                     'locale_code': locale_code,
-                     'target_locale_codes': target_locale_codes,
-                     'name': name})
+        url = self.config.url('add_document', identifier)
+        data = self._params(('identifier', identifier),
+                            ('document_store_id', document_store_id),
+                            ('document_token', document_token),
+                            ('locale_code', locale_code),
+                            ('target_locale_codes', target_locale_codes),
+                            ('name', name))
         return self.request_json(url, data=data, method='POST')
 
 
@@ -370,8 +560,8 @@ class QuotesMixin(AuthenticatedTT):
     """Quotes mixin"""
     def list_quotes(self, identifier):
         """List quotes of an order"""
-        url = self.config['list_quotes'].format(identifier=identifier)
-        params = self.params
+        url = self.config.url('list_quotes', identifier)
+        params = self._params()
         return self.request_json(url, params=params, method='GET')
 
 
@@ -379,8 +569,8 @@ class InvoicesMixin(AuthenticatedTT):
     """Invoices mixin"""
     def list_invoices(self, identifier):
         """List invoices of an order"""
-        url = self.config['list_invoices'].format(identifier=identifier)
-        params = self.params
+        url = self.config.url('list_invoices', identifier)
+        params = self._params()
         return self.request_json(url, params=params, method='GET')
 
 
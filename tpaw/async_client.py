@@ -0,0 +1,233 @@
+"""Provides an asyncio based client for Toptranslation's API.
+
+This module requires aiohttp, which can be installed with the `async` extra.
+All the API methods of :class:`AsyncToptranslation` are coroutines, so
+several independent calls can be awaited concurrently::
+
+    async with AsyncToptranslation('my app') as client:
+        orders = await asyncio.gather(*[client.show_order(identifier)
+                                        for identifier in identifiers])
+
+Unlike :class:`tpaw.Toptranslation`, the asyncio client has no handler: it
+does not accept one, it has no response cache so `evict` does nothing, and
+it retries on its own. It shares the token bucket of DefaultHandler, and
+only keeps the name, value, domain and path of the cookies it receives.
+"""
+
+import asyncio
+import os
+import sys
+from html import unescape
+
+import aiohttp
+from requests.cookies import get_cookie_header
+
+from tpaw import Toptranslation, _json_loads
+from tpaw.handlers import DefaultHandler
+from tpaw.internal import _prepare_request, _raise_response_exceptions
+
+
+def _fields(values):
+    """Return the (key, value) pairs to send for values.
+
+    aiohttp does not accept None values and does not expand sequences the
+    way requests does, so None values are dropped and sequences are sent as
+    repeated keys.
+
+    """
+    if not isinstance(values, dict):
+        return values
+    fields = []
+    for key, value in values.items():
+        if isinstance(value, (list, tuple)):
+            fields.extend((key, item) for item in value if item is not None)
+        elif value is not None:
+            fields.append((key, value))
+    return fields
+
+
+class AsyncToptranslation(Toptranslation):
+    """Provides asyncio access to Toptranslation's API.
+
+    The API is the same as the one of :class:`tpaw.Toptranslation`, except
+    that every API method returns a coroutine, `get_content` and
+    `get_locales` return asynchronous generators, and `close` must be
+    awaited once the client is no longer needed.
+
+    """
+
+    def __init__(self, user_agent, site_name=None, handler=None, **kwargs):
+        """Initialize an asyncio instance.
+
+        The aiohttp session is only created on the first request, as it must
+        be bound to the running event loop.
+
+        """
+        if handler is not None:
+            raise TypeError('AsyncToptranslation does not support handlers')
+        super(AsyncToptranslation, self).__init__(user_agent, site_name,
+                                                  **kwargs)
+        self._client = None
+
+    async def __aenter__(self):
+        """Return the client itself."""
+        return self
+
+    async def __aexit__(self, *_):
+        """Close the aiohttp session."""
+        await self.close()
+
+    async def close(self):
+        """Close the aiohttp session and its keep-alive connections."""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+    def _get_client(self):
+        """Return the aiohttp session, creating it if needed."""
+        if self._client is None:
+            connector = aiohttp.TCPConnector(limit=self.config.pool_size,
+                                             keepalive_timeout=75)
+            # Cookies are kept in self.http.cookies, like the sync client
+            self._client = aiohttp.ClientSession(
+                connector=connector, cookie_jar=aiohttp.DummyCookieJar())
+        return self._client
+
+    def _default_handler(self):
+        """Return None, requests are sent by the aiohttp session."""
+        return None
+
+    def _store_cookies(self, response):
+        """Store the cookies set by response in self.http.cookies."""
+        for name, morsel in response.cookies.items():
+            self.http.cookies.set(name, morsel.value,
+                                  domain=morsel['domain'] or response.url.host,
+                                  path=morsel['path'] or '/')
+
+    async def _rate_limit(self):
+        """Wait until a request may be sent.
+
+        See DefaultHandler.take_token, whose bucket is shared with the
+        synchronous clients of the process.
+
+        """
+        delay = DefaultHandler.take_token(self.config.api_request_delay,
+                                          self.config.api_request_burst)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _request(self, url, params=None, data=None, files=None,
+                       auth=None, timeout=None, raw_response=False,
+                       method=None, headers=None):
+        """Given a page url and a dict of params, open and return the page.
+
+        See BaseTT._request for the meaning of the arguments. Requests that
+        fail with one of DefaultHandler.RETRY_CODES are retried up to 3
+        times with exponential backoff, unless they upload a form.
+
+        """
+        request = _prepare_request(self, url, params, data, auth, files,
+                                   method, headers)
+        if isinstance(request.data, aiohttp.FormData):
+            # Let aiohttp set the multipart boundary
+            request.headers.pop('Content-Type', None)
+            # A form is consumed when sent, thus it cannot be retried
+            retries = 0
+        else:
+            retries = 3
+        body = None if request.method == 'GET' else _fields(request.data)
+        cookie = get_cookie_header(self.http.cookies, request)
+        if cookie:
+            request.headers['Cookie'] = cookie
+        timeout = self.config.timeout if timeout is None else timeout
+        proxy = self.http.proxies.get(request.url.split(':', 1)[0])
+        client = self._get_client()
+        for attempt in range(retries + 1):
+            await self._rate_limit()
+            response = await client.request(
+                request.method, request.url, params=_fields(request.params),
+                data=body, headers=request.headers, proxy=proxy,
+                allow_redirects=request.method in ('GET', 'HEAD'),
+                timeout=aiohttp.ClientTimeout(total=timeout))
+            # Reading the whole body releases the connection to the pool
+            await response.read()
+            if (response.status not in DefaultHandler.RETRY_CODES or
+                    attempt == retries):
+                break
+            await asyncio.sleep(0.25 * 2 ** attempt)
+        if self.config.log_requests >= 2:
+            msg = 'status: {0}\n'.format(response.status)
+            sys.stderr.write(msg)
+        _raise_response_exceptions(response, response.status)
+        self._store_cookies(response)
+        if raw_response:
+            return response
+        text = await response.text()
+        if response.content_type == 'application/json':
+            return text
+        return unescape(text)
+
+    async def get_content(self, url, params=None, method=None,
+                          root_field='data', **kwargs):
+        """Method to return JSON Content"""
+        params = params or {}
+        data = await self.request_json(url, method=method, params=params)
+        root = data.get(root_field, data)
+        for thing in root:
+            yield thing
+
+    def evict(self, urls):
+        """Return 0, the asyncio client does not cache responses."""
+        return 0
+
+    async def request(self, url, params=None, data=None, method=None,
+                      files=None, headers=None):
+        """Make a HTTP request and return the response"""
+        return await self._request(url, params, data, raw_response=True,
+                                   method=method, files=files,
+                                   headers=headers)
+
+    async def request_json(self, url, params=None, data=None,
+                           as_objects=True, method=None, files=None,
+                           headers=None):
+        """Get the JSON processed from a page"""
+        response = await self._request(url, params, data, raw_response=True,
+                                       method=method, files=files,
+                                       headers=headers)
+        return _json_loads(await response.read())
+
+    async def batch(self, requests):
+        """Perform several API calls concurrently and return their JSON.
+
+        See BaseTT.batch for the format of `requests`.
+
+        """
+        def perform(method, key, params):
+            url = self.config.url(key, params.get('identifier'))
+            params = self._params(*params.items())
+            if method == 'GET':
+                return self.request_json(url, params=params, method=method)
+            return self.request_json(url, data=params, method=method)
+
+        return await asyncio.gather(*[perform(*item) for item in requests])
+
+    async def upload_token(self, *args, **kwargs):
+        """Create an upload token for the document store."""
+        url = self.config['upload_token']
+        data = self._params() or None
+        response = await self.request_json(url, data=data, method='POST',
+                                           *args, **kwargs)
+        return response['data']['upload_token']
+
+    async def upload_document(self, token, document, document_type):
+        """Upload a document"""
+        url = self.config.document_store_url('upload_document')
+        with open(document, 'rb') as handle:
+            # aiohttp streams file objects, the file is not loaded in memory
+            data = aiohttp.FormData()
+            data.add_field('token', token)
+            data.add_field('type', document_type)
+            data.add_field('file', handle,
+                           filename=os.path.basename(document),
+                           content_type='application/octet-stream')
+            return await self.request_json(url, data=data, method='POST')
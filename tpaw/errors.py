@@ -8,10 +8,18 @@ server side. A number of classes extend these two main exceptions for more
 specific exceptions.
 """
 
-from __future__ import print_function, unicode_literals
+ERROR_MAPPING = {}  # Maps an API error type to its exception class
 
-import inspect
-import sys
+
+def _register(cls):
+    """Add cls to ERROR_MAPPING under its ERROR_TYPE and return it.
+
+    Use it as a decorator on the exception classes that declare an
+    ERROR_TYPE.
+
+    """
+    ERROR_MAPPING[cls.ERROR_TYPE] = cls
+    return cls
 
 
 class TPAWException(Exception):
@@ -120,15 +128,3 @@ class OAuthException(TPAWException):
     def __str__(self):
         """Return the message along with the url."""
         return self.message + " on url {0}".format(self.url)
-
-
-def _build_error_mapping():
-    def predicate(obj):
-        """Build error mapping """
-        return inspect.isclass(obj) and hasattr(obj, 'ERROR_TYPE')
-
-    tmp = {}
-    for _, obj in inspect.getmembers(sys.modules[__name__], predicate):
-        tmp[obj.ERROR_TYPE] = obj
-    return tmp
-ERROR_MAPPING = _build_error_mapping()
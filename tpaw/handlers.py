@@ -1,76 +1,190 @@
 """Provides classes that handle request dispatching."""
 
-from __future__ import print_function, unicode_literals
-
 import time
 from functools import wraps
 from threading import Lock
 from timeit import default_timer as timer
 from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 class DefaultHandler(object):
     """The base handler that provides thread-safe rate limiting enforcement."""
 
-    last_call = {}  # Stores a two-item list: [lock, previous_call_time]
-    rl_lock = Lock()  # lock used for adding items to last_call
+    RETRY_CODES = (502, 503, 504)
+    RETRY_METHODS = frozenset(['GET', 'POST', 'PATCH', 'PUT', 'DELETE'])
+    CACHE_SIZE = 256
+
+    rl_bucket = [None, 0.0]  # Stores [available_tokens, last_refill_time]
+    rl_lock = Lock()  # lock used for accessing rl_bucket
+
+    @classmethod
+    def take_token(cls, rate_delay, burst):
+        """Take a token from the bucket and return how long to wait for it.
+
+        We are allowed to  make on average one API request  every
+        api_request_delay seconds as specified in tpaw.ini. Requests are
+        metered through a single token bucket, shared by every handler
+        of the  process, that holds up to  `burst` tokens and refills at
+        one token every `rate_delay` seconds. A request takes a token if
+        one is available, otherwise it must wait until its token has been
+        refilled.
+
+        The lock is only held while taking the token, the caller does the
+        waiting, so several requests can be in flight at once.
+
+        """
+        if rate_delay <= 0:
+            return 0
+        with cls.rl_lock:
+            now = timer()
+            tokens, last_refill = cls.rl_bucket
+            if tokens is None:  # The bucket starts full
+                tokens = float(burst)
+            tokens = min(float(burst),
+                         tokens + (now - last_refill) / rate_delay)
+            # Going below zero reserves the next token to be refilled
+            tokens -= 1
+            cls.rl_bucket[:] = [tokens, now]
+        return -tokens * rate_delay if tokens < 0 else 0
 
     @staticmethod
     def rate_limit(function):
         """Return a decorator that enforces API request limit guidelines.
 
-        We are allowed  to make a API  request every api_request_delay
-        seconds as specified in  tpaw.ini. Any function decorated with
-        this  will be  forced to  delay _rate_delay  seconds from  the
-        calling  of  the  last  function decorated  with  this  before
-        executing.
+        Any function decorated with this will first take a token through
+        `take_token` using _rate_delay and _rate_burst, sleeping until the
+        token is available. See `take_token` for the details.
 
         This  decorator must  be applied  to a  DefaultHandler class
-        method  or  instance  method   as  it  assumes  `rl_lock`  and
-        `last_call` are available.
+        method or  instance method as  it assumes  `take_token` is
+        available.
 
         """
         @wraps(function)
-        def wrapped(cls, _rate_delay, **kwargs):
-            cls.rl_lock.acquire()
-            lock_last = cls.last_call.setdefault(0, [Lock(), 0])
-            with lock_last[0]:  # Obtain the domain specific lock
-                cls.rl_lock.release()
-                # Sleep if necessary, then perform the request
+        def wrapped(cls, _rate_delay, _rate_burst, **kwargs):
+            delay = cls.take_token(_rate_delay, _rate_burst)
+            if delay > 0:
+                time.sleep(delay)
+            return function(cls, **kwargs)
+        return wrapped
+
+    @staticmethod
+    def with_cache(function):
+        """Return a decorator that caches responses of idempotent requests.
+
+        Successful responses  are kept for _cache_timeout  seconds under
+        _cache_key, whose first item is the requested url. At most
+        CACHE_SIZE responses are kept, the one closest to expiry being
+        dropped first. Requests with a true _cache_ignore bypass the cache
+        entirely.
+
+        This  decorator must  be applied  to a  DefaultHandler instance
+        method as it assumes  `cache`, `timeouts` and `ca_lock` are
+        available.
+
+        """
+        @wraps(function)
+        def wrapped(cls, _cache_key, _cache_ignore, _cache_timeout, **kwargs):
+            def clear_timeouts():
+                """Drop the expired entries, and the oldest if still full."""
                 now = timer()
-                delay = lock_last[1] + _rate_delay - now
-                if delay > 0:
-                    now += delay
-                    time.sleep(delay)
-                lock_last[1] = now
+                for key in list(cls.timeouts):
+                    if cls.timeouts[key] <= now:
+                        del cls.timeouts[key]
+                        del cls.cache[key]
+                if len(cls.cache) >= cls.CACHE_SIZE:
+                    oldest = min(cls.timeouts, key=cls.timeouts.get)
+                    del cls.timeouts[oldest]
+                    del cls.cache[oldest]
+
+            if _cache_ignore or _cache_timeout <= 0:
                 return function(cls, **kwargs)
+            with cls.ca_lock:
+                expiry = cls.timeouts.get(_cache_key)
+                if expiry is not None and timer() < expiry:
+                    return cls.cache[_cache_key]
+            # The lock is released while the request is made, so the same
+            # request may get through more than once from several threads.
+            result = function(cls, **kwargs)
+            # Error responses result in an exception and must not be cached
+            if result.status_code != 200:
+                return result
+            with cls.ca_lock:
+                clear_timeouts()
+                cls.timeouts[_cache_key] = timer() + _cache_timeout
+                cls.cache[_cache_key] = result
+            return result
         return wrapped
 
-    @classmethod
-    def evict(cls, urls):  # pylint: disable=W0613
+    def evict(self, urls):
         """Method utilized to evict entries for the given urls.
 
-        :param urls: An iterable containing normalized urls.
+        :param urls: A url or an iterable containing urls, without their
+            query string.
         :returns: The number of items removed from the cache.
 
-        By default this method returns False as a cache need not be present.
-
         """
-        return 0
+        if isinstance(urls, str):
+            urls = [urls]
+        urls = set(urls)
+        retval = 0
+        with self.ca_lock:
+            for key in list(self.cache):
+                if key[0] in urls:
+                    retval += 1
+                    del self.cache[key]
+                    del self.timeouts[key]
+        return retval
 
     def __del__(self):
-        """Cleanup the HTTP session."""
-        if self.http:
-            try:
-                self.http.close()
-            except:  # Never fail  pylint: disable=W0702
-                pass
-
-    def __init__(self):
-        """Establish the HTTP session."""
-        self.http = Session()  # Each instance should have its own session
+        """Cleanup the HTTP sessions."""
+        for http in (getattr(self, 'http', None),
+                     getattr(self, 'stream_http', None)):
+            if http:
+                try:
+                    http.close()
+                except:  # Never fail  pylint: disable=W0702
+                    pass
+
+    def __init__(self, pool_size=32):
+        """Establish the HTTP session.
+
+        :param pool_size: The number of keep-alive connections kept open per
+            host. Every request dispatched through this handler shares them.
 
-    def request(self, request, proxies, timeout, **_):
+        """
+        self.cache = {}  # Maps a cache key to the cached response
+        self.timeouts = {}  # Maps a cache key to the expiry of its response
+        self.ca_lock = Lock()  # lock used for accessing cache and timeouts
+        self.http = Session()  # Each instance should have its own session
+        # Retries happen at the connection layer so they reuse the already
+        # open keep-alive socket. Once they are exhausted the last response
+        # is returned and BaseTT raises the matching HTTPException.
+        #
+        # POST and PATCH are deliberately retried on RETRY_CODES: a 502, 503
+        # or 504 from the gateway means the API did not process the call.
+        # Read errors are never retried, since the server may already have
+        # applied a non-idempotent request whose response timed out.
+        retry = Retry(total=3, read=0, backoff_factor=0.25,
+                      raise_on_status=False,
+                      status_forcelist=self.RETRY_CODES,
+                      allowed_methods=self.RETRY_METHODS)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=retry)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        # Streamed bodies, such as document uploads, can only be read once:
+        # a retry would send an empty body, so they get a session that never
+        # retries.
+        self.stream_http = Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=0)
+        self.stream_http.mount('https://', adapter)
+        self.stream_http.mount('http://', adapter)
+
+    def request(self, request, proxies, timeout, stream=False, **_):
         """Responsible for dispatching the request and returning the result.
 
         Network level exceptions should be raised and only
@@ -82,12 +196,21 @@ class DefaultHandler(object):
             request.
         :param timeout: Specifies the maximum time that the actual HTTP request
             can take.
+        :param stream: If True the response body is only downloaded as it is
+            read.
 
         ``**_`` should be added to the method call to ignore the extra
         arguments intended for the cache handler.
 
         """
-        return self.http.send(request, proxies=proxies, timeout=timeout,
-                              allow_redirects=False)
-DefaultHandler.request = DefaultHandler.rate_limit(
-    DefaultHandler.request)
+        # Redirects of idempotent requests are followed over the pooled
+        # connections, the others are returned to the caller
+        allow_redirects = request.method in ('GET', 'HEAD')
+        if isinstance(request.body, (type(None), str, bytes)):
+            http = self.http
+        else:
+            http = self.stream_http
+        return http.send(request, proxies=proxies, timeout=timeout,
+                         stream=stream, allow_redirects=allow_redirects)
+DefaultHandler.request = DefaultHandler.with_cache(
+    DefaultHandler.rate_limit(DefaultHandler.request))
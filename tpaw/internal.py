@@ -1,29 +1,27 @@
 """Internal helper functions"""
 
 import sys
-from requests import Request
+from requests import Request, codes
+from tpaw import errors
 
 
 def _prepare_request(session, url, params, data, auth, files,
-                     method=None):
+                     method=None, extra_headers=None):
     """Return a requests Request object that can be "prepared"."""
+    headers = session._base_headers.copy()  # pylint: disable=W0212
+    if extra_headers:
+        headers.update(extra_headers)
     # Requests using OAuth for authorization must switch to using the oauth
     # domain.
     if getattr(session, '_use_oauth', False):
-        bearer = 'bearer {0}'.format(session.access_token)
-        headers = {'Authorization': bearer}
+        headers['Authorization'] = session._bearer  # pylint: disable=W0212
         config = session.config
-        for prefix in (config.api_url, config.permalink_url):
-            if url.startswith(prefix):
-                if config.log_requests >= 1:
-                    msg = 'substituting {0} for {1} in url\n'.format(
-                        config.oauth_url, prefix)
-                    sys.stderr.write(msg)
-                url = config.oauth_url + url[len(prefix):]
-                break
-    else:
-        headers = {}
-    headers.update(session.http.headers)
+        if url.startswith(config.api_url):
+            if config.log_requests >= 1:
+                msg = 'substituting {0} for {1} in url\n'.format(
+                    config.oauth_url, config.api_url)
+                sys.stderr.write(msg)
+            url = config.oauth_url + url[len(config.api_url):]
 
     if method:
         pass
@@ -60,3 +58,23 @@ def _prepare_request(session, url, params, data, auth, files,
     request.data = data
     request.files = files
     return request
+
+
+def _raise_response_exceptions(response, status_code=None):
+    """Raise specific errors on some status codes.
+
+    :param status_code: The status of the response, defaults to
+        `response.status_code`. Responses of other libraries, such as
+        aiohttp, pass it explicitly.
+
+    """
+    if status_code is None:
+        status_code = response.status_code
+    if status_code == codes.forbidden:  # pylint: disable=E1101
+        raise errors.Forbidden(_raw=response)
+    elif status_code == codes.not_found:  # pylint: disable=E1101
+        raise errors.NotFound(_raw=response)
+    elif status_code >= 400:
+        message = 'HTTP error {0} on url {1}'.format(
+            status_code, response.url)
+        raise errors.HTTPException(_raw=response, message=message)
@@ -2,6 +2,8 @@
 class ToptranslationObject(object):
     """Base class that represents an Toptranslation API object"""
 
+    __slots__ = ('session',)
+
     @classmethod
     def from_api_response(cls, session, json_dict):
         """Return an instance of the appropriate class from the json_dict."""
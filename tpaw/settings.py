@@ -2,19 +2,17 @@
 
 """Provides the code to load TPAW's configuration file `tpaw.ini'."""
 
+import configparser
 import os
-import sys
-
-try:
-    import ConfigParser as configparser
-except ImportError:
-    import configparser
+import pkgutil
 
 
 def _load_configuration():
-    """Attempt to load settings from various tpaw.ini files"""
+    """Load the bundled tpaw.ini and overlay the user's tpaw.ini files"""
     config = configparser.RawConfigParser()
-    module_dir = os.path.dirname(sys.modules[__name__].__file__)
+    # Read the defaults through the package loader, which also works when
+    # TPAW is imported from a zip or pex archive
+    config.read_string(pkgutil.get_data('tpaw', 'tpaw.ini').decode('utf-8'))
     if 'APPDATA' in os.environ:	 # Do we have to support Windows?
         os_config_path = os.environ['APPDATA']
     elif 'XDG_CONFIG_HOME' in os.environ:  # Modern Linux
@@ -23,12 +21,10 @@ def _load_configuration():
         os_config_path = os.path.join(os.environ['HOME'], '.config')
     else:
         os_config_path = None
-    locations = [os.path.join(module_dir, 'tpaw.ini'), 'tpaw.ini']
+    locations = ['tpaw.ini']
     if os_config_path is not None:
-        locations.insert(1, os.path.join(os_config_path, 'tpaw.ini'))
-    if not config.read(locations):
-        raise Exception('Could not find config file in any of: {0}'
-                        .format(locations))
+        locations.insert(0, os.path.join(os_config_path, 'tpaw.ini'))
+    config.read(locations)
     return config
 
 